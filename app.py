@@ -5,41 +5,110 @@ Usage: streamlit run app.py
 - Low-end VM defaults: 512 MB, 50 CPU units
 - Visual deadlock flash for examiner when 'deadlocked' detected
 - CPU mapping normalized so total CPU units do not exceed VIRTUAL_CPU_UNITS
-- Live update without full reload
+- Live update via st_autorefresh (one short script run per tick)
 """
 
 import time
-import psutil
+import threading
+import numpy as np
 import pandas as pd
 import streamlit as st
-import json
+import orjson
 import os
-import matplotlib.pyplot as plt
+import tempfile
+import logging
+from collections import deque
+from itertools import islice
+from streamlit_autorefresh import st_autorefresh
 
-from decision_tree import compute_scores, VIRTUAL_RAM_MB, VIRTUAL_CPU_UNITS
-from vpc import map_host_to_virtual, get_visible_windows, get_active_window_info
+from decision_tree import (
+    compute_scores, wait_times_dict, VIRTUAL_RAM_MB, VIRTUAL_CPU_UNITS,
+    ACTIONS, WAIT, PREEMPT, KILL, DEADLOCKED,
+)
+from vpc import map_host_to_virtual, HostSampler
+
+logger = logging.getLogger(__name__)
 
 SESSION_FILE = ".session_store.json"
+SAVE_MIN_INTERVAL = 10.0  # seconds between session-store writes
+
+# decision table layout; compact dtypes (small numeric ranges, repeating names/actions)
+DECISION_COLUMNS = ['pid','name','v_cpu_alloc','v_ram_alloc','w_cpu','w_ram','w_wait','w_vis','w_hist','score','action','reason','wait_time_sec']
+DECISION_DTYPES = {
+    'pid': 'int32', 'name': 'category', 'action': pd.CategoricalDtype(ACTIONS),
+    'v_cpu_alloc': 'float32', 'v_ram_alloc': 'float32',
+    'w_cpu': 'float32', 'w_ram': 'float32', 'w_wait': 'float32',
+    'w_vis': 'float32', 'w_hist': 'float32', 'score': 'float32',
+}
+
+# stable demo tasks injected every tick (keeps behavior consistent)
+EXTRA_TASKS = [
+    {"pid": 9901, "name": "AI_Optimizer", "v_cpu_alloc": 5, "v_ram_alloc": 40},
+    {"pid": 9902, "name": "MemoryBalancer", "v_cpu_alloc": 4, "v_ram_alloc": 30},
+    {"pid": 9903, "name": "DeadlockResolver", "v_cpu_alloc": 3, "v_ram_alloc": 25},
+]
 
 def load_session_store():
     if os.path.exists(SESSION_FILE):
         try:
-            with open(SESSION_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            with open(SESSION_FILE, "rb") as f:
+                data = orjson.loads(f.read())
                 return data
         except Exception:
             return {}
     return {}
 
 def save_session_store(store):
+    tmp_path = None
     try:
         dumpable = dict(store)
-        if 'usage_history' in dumpable:
-            dumpable['usage_history'] = dict(dumpable['usage_history'])
-        with open(SESSION_FILE, "w", encoding="utf-8") as f:
-            json.dump(dumpable, f, indent=2)
-    except Exception:
-        pass
+        # write to a unique temp file and swap it in, so readers never see a partial
+        # file and concurrent savers (one thread per session) never share a temp file
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(SESSION_FILE)),
+                                         prefix=".session_store.", suffix=".tmp", delete=False) as f:
+            tmp_path = f.name
+            f.write(orjson.dumps(dumpable, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS))
+        os.replace(tmp_path, SESSION_FILE)
+    except Exception as e:
+        logger.exception("save_session_store failed: %s", e)
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def persist_session_store(store):
+    """
+    Save the scoring store in a background thread, only when its content
+    changed and at most once every SAVE_MIN_INTERVAL seconds.
+    """
+    digest = hash((
+        store['wait_arr'].tobytes(), len(store['pid_index']),
+        store['usage_cms'].tobytes(),
+    ))
+    now = time.monotonic()
+    if digest == st.session_state.get('_store_hash'):
+        return
+    if now - st.session_state.get('_store_saved_at', float('-inf')) < SAVE_MIN_INTERVAL:
+        return
+    st.session_state['_store_hash'] = digest
+    st.session_state['_store_saved_at'] = now
+    snapshot = {'wait_times': wait_times_dict(store), 'usage_cms': store['usage_cms'].copy()}
+    threading.Thread(target=save_session_store, args=(snapshot,), daemon=True).start()
+
+@st.cache_resource
+def get_host_sampler():
+    """One sampler thread per server process, shared by every session."""
+    sampler = HostSampler()
+    sampler.start()
+    return sampler
+
+def top_k_indices(values, k):
+    """Indices of the k largest values, largest first (partial sort, O(n) + O(k log k))."""
+    values = np.asarray(values)
+    idx = np.argpartition(-values, k - 1)[:k] if len(values) > k else np.arange(len(values))
+    return idx[np.argsort(-values[idx], kind='stable')]
+
+def recent(dq, n):
+    """Last n items of a deque, oldest first."""
+    return list(islice(dq, max(0, len(dq) - n), None))
 
 
 st.set_page_config(page_title="AI Virtual Deadlock Simulator (Low-end Demo)", layout="wide")
@@ -48,22 +117,20 @@ st.title("AI Deadlock Handling — Low-end Virtual PC (512MB / 50 CPU units)")
 # session defaults
 if 'refresh_interval' not in st.session_state:
     st.session_state['refresh_interval'] = 3
-if 'wait_times' not in st.session_state:
-    st.session_state['wait_times'] = {}
-if 'usage_history' not in st.session_state:
-    st.session_state['usage_history'] = {}
+if 'score_store' not in st.session_state:
+    # scoring state (SoA wait table + usage sketch), seeded once from disk
+    persisted = load_session_store()
+    st.session_state['score_store'] = {
+        # JSON object keys come back as str; compute_scores looks pids up as int
+        'wait_times': {int(k): float(v) for k, v in (persisted.get('wait_times') or {}).items()},
+        # older store files carry an exact usage_history; compute_scores folds it into the sketch
+        'usage_cms': persisted.get('usage_cms'),
+        'usage_history': persisted.get('usage_history') or {},
+    }
 if 'log' not in st.session_state:
-    st.session_state['log'] = []
+    st.session_state['log'] = deque(maxlen=500)
 if 'killed_history' not in st.session_state:
-    st.session_state['killed_history'] = []
-
-
-# load persisted
-persisted = load_session_store()
-if persisted.get('wait_times') and not st.session_state.get('wait_times'):
-    st.session_state['wait_times'] = persisted.get('wait_times')
-if persisted.get('usage_history') and not st.session_state.get('usage_history'):
-    st.session_state['usage_history'] = persisted.get('usage_history')
+    st.session_state['killed_history'] = deque(maxlen=200)
 
 # sidebar
 st.sidebar.header("Simulation Controls")
@@ -71,269 +138,237 @@ refresh_interval = st.sidebar.slider("Refresh interval (seconds)", 2, 6, st.sess
 st.session_state['refresh_interval'] = refresh_interval
 live_mode = st.sidebar.toggle("🔄 Live Update Mode", value=True)
 
-placeholder = st.empty()
-
-# ================== MAIN LIVE UPDATE LOOP ==================
-run_loop = True
+# ================== LIVE UPDATE ==================
+# each tick is a fresh, short script run (no blocking sleep loop)
 if live_mode:
-    while run_loop:
-        with placeholder.container():
-
-            # 1) gather host snapshot (safer cpu sampling)
-            processes = []
-            for proc in psutil.process_iter(['pid','name']):
-                try:
-                    proc.cpu_percent(interval=None)
-                except Exception:
-                    pass
-
-            time.sleep(0.2)  # small stable sampling
-
-            for proc in psutil.process_iter(['pid','name','cpu_percent','memory_percent']):
-                try:
-                    info = {}
-                    try:
-                        info = proc.as_dict(attrs=['pid','name','cpu_percent','memory_percent'])
-                    except Exception:
-                        info = proc.info
-                    info["cpu_percent"] = float(info.get("cpu_percent", 0.0) or 0.0)
-                    info["memory_percent"] = float(info.get("memory_percent", 0.0) or 0.0)
-                    processes.append(info)
-                except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                    continue
-                except Exception:
-                    continue
-
-            df_host = pd.DataFrame(processes)
-            if df_host.empty:
-                st.warning("No host process data available.")
-                break
-
-            visible_windows = get_visible_windows()
-            active_info = get_active_window_info()
-
-            # 2) map host -> virtual (low-end)
-            df_virtual = map_host_to_virtual(df_host, VIRTUAL_RAM_MB, VIRTUAL_CPU_UNITS)
-
-            # inject stable demo tasks (keeps behavior consistent)
-            extra_tasks = [
-                {"pid": 9901, "name": "AI_Optimizer", "v_cpu_alloc": 5, "v_ram_alloc": 40},
-                {"pid": 9902, "name": "MemoryBalancer", "v_cpu_alloc": 4, "v_ram_alloc": 30},
-                {"pid": 9903, "name": "DeadlockResolver", "v_cpu_alloc": 3, "v_ram_alloc": 25},
-            ]
-            if df_virtual is None or df_virtual.empty:
-                df_virtual = pd.DataFrame(extra_tasks)
-            else:
-                df_virtual = pd.concat([df_virtual, pd.DataFrame(extra_tasks)], ignore_index=True)
-
-            # 3) scoring
-            session_store = {
-                'wait_times': st.session_state.get('wait_times', {}),
-                'usage_history': st.session_state.get('usage_history', {}),
-                'refresh_interval': refresh_interval
-            }
-            decisions = compute_scores(df_virtual, visible_windows=visible_windows, session_store=session_store)
-
-            # persist session store
-            st.session_state['wait_times'] = session_store.get('wait_times', st.session_state.get('wait_times', {}))
-            st.session_state['usage_history'] = session_store.get('usage_history', st.session_state.get('usage_history', {}))
-            save_session_store({'wait_times': st.session_state['wait_times'], 'usage_history': st.session_state['usage_history']})
-
-            # 4) apply actions
-            adjusted = []
-            killed_this_cycle = []
-            pending_list = []
-            deadlock_detected = False
-            deadlocked_items = []
-
-            for proc in decisions:
-                v_cpu = proc["v_cpu_alloc"]
-                v_ram = proc["v_ram_alloc"]
-
-                if proc["action"] == "preempt":
-                    v_cpu = round(v_cpu * 0.6, 2)
-                    v_ram = round(v_ram * 0.6, 2)
-                    adjusted.append({
-                        "pid": proc["pid"],
-                        "name": proc["name"],
-                        "v_cpu_alloc": v_cpu,
-                        "v_ram_alloc": v_ram,
-                        "action": "preempt",
-                        "reason": proc.get("reason", "")
-                    })
-                elif proc["action"] == "kill":
-                    killed_this_cycle.append({
-                        "pid": proc["pid"],
-                        "name": proc["name"],
-                        "v_cpu_alloc": proc["v_cpu_alloc"],
-                        "v_ram_alloc": proc["v_ram_alloc"],
-                        "score": proc["score"],
-                        "reason": proc.get("reason", "")
-                    })
-                    st.session_state['killed_history'].append({
-                        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
-                        "pid": proc["pid"],
-                        "name": proc["name"],
-                        "v_cpu_alloc": proc["v_cpu_alloc"],
-                        "v_ram_alloc": proc["v_ram_alloc"],
-                        "score": proc["score"],
-                        "reason": proc.get("reason", "")
-                    })
-                elif proc["action"] == "deadlocked":
-                    deadlock_detected = True
-                    deadlocked_items.append(proc)
-                    st.session_state['killed_history'].append({
-                        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
-                        "pid": proc["pid"],
-                        "name": proc["name"],
-                        "v_cpu_alloc": proc["v_cpu_alloc"],
-                        "v_ram_alloc": proc["v_ram_alloc"],
-                        "score": proc["score"],
-                        "reason": proc.get("reason", "")
-                    })
-                else:
-                    adjusted.append({
-                        "pid": proc["pid"],
-                        "name": proc["name"],
-                        "v_cpu_alloc": proc["v_cpu_alloc"],
-                        "v_ram_alloc": proc["v_ram_alloc"],
-                        "action": "wait",
-                        "reason": proc.get("reason", "")
-                    })
-                    pending_list.append({
-                        "pid": proc["pid"],
-                        "name": proc["name"],
-                        "v_cpu_alloc": proc["v_cpu_alloc"],
-                        "v_ram_alloc": proc["v_ram_alloc"],
-                        "score": proc["score"]
-                    })
-
-            df_virtual_adj = pd.DataFrame(adjusted)
-
-            # 5) auto recovery/compression
-            total_vram = float(df_virtual_adj["v_ram_alloc"].sum()) if not df_virtual_adj.empty else 0.0
-            total_vcpu = float(df_virtual_adj["v_cpu_alloc"].sum()) if not df_virtual_adj.empty else 0.0
-
-            if total_vram > 0 and total_vram > VIRTUAL_RAM_MB:
-                compression_ratio = min(1.0, VIRTUAL_RAM_MB / total_vram)
-                df_virtual_adj["v_ram_alloc"] = (df_virtual_adj["v_ram_alloc"] * compression_ratio).round(2)
-                total_vram = float(df_virtual_adj["v_ram_alloc"].sum())
-
-            if total_vram > VIRTUAL_RAM_MB:
-                score_map = {d['pid']: d['score'] for d in decisions}
-                while total_vram > VIRTUAL_RAM_MB and not df_virtual_adj.empty and score_map:
-                    worst_pid = min(score_map.keys(), key=lambda p: score_map.get(p, 1.0))
-                    df_virtual_adj = df_virtual_adj[df_virtual_adj["pid"] != worst_pid]
-                    score_map.pop(worst_pid, None)
-                    total_vram = float(df_virtual_adj["v_ram_alloc"].sum())
-
-            total_vcpu = float(df_virtual_adj["v_cpu_alloc"].sum()) if not df_virtual_adj.empty else 0.0
-
-            # 6) host metrics
-            host_cpu_percent = psutil.cpu_percent(interval=0.5)
-            host_ram_percent = psutil.virtual_memory().percent
-
-            if total_vram < VIRTUAL_RAM_MB * 0.8:
-                status = "Stable"
-            elif total_vram < VIRTUAL_RAM_MB:
-                status = "Near Limit"
-            else:
-                status = "Overload"
-
-            log_entry = f"{time.strftime('%H:%M:%S')} | Status: {status} | Virtual RAM {round(total_vram,2)}MB / {VIRTUAL_RAM_MB}MB | Virtual CPU {round(total_vcpu,2)} / {VIRTUAL_CPU_UNITS}"
-            st.session_state['log'].append(log_entry)
-            if len(st.session_state['log']) > 500:
-                st.session_state['log'] = st.session_state['log'][-500:]
-
-            # 7) UI Rendering
-            st.subheader("Host Snapshot")
-            hc1, hc2, hc3 = st.columns(3)
-            hc1.metric("Host CPU %", f"{host_cpu_percent}%")
-            hc2.metric("Host RAM %", f"{host_ram_percent}%")
-            hc3.write(f"Active: {active_info.get('process_name')} — {active_info.get('title')}")
-
-            st.markdown("---")
-            st.subheader("Virtual PC Summary (Low-end)")
-            vc1, vc2, vc3 = st.columns(3)
-            vc1.metric("Virtual CPU Used", f"{round(total_vcpu,2)} / {VIRTUAL_CPU_UNITS}")
-            vc2.metric("Virtual RAM Used", f"{round(total_vram,2)} MB / {VIRTUAL_RAM_MB} MB")
-            vc3.write(f"Status: {status}")
-
-            st.markdown("**Resource balance (visual)**")
-            fig1, ax1 = plt.subplots()
-            used = max(0.0, total_vcpu)
-            free = max(0.0, VIRTUAL_CPU_UNITS - used)
-            ax1.pie([used, free], labels=["Used CPU", "Free CPU"], autopct='%1.1f%%')
-            st.pyplot(fig1)
-
-            st.markdown("---")
-            st.subheader("Virtual Task Table (Adjusted)")
-            if not df_virtual_adj.empty:
-                st.dataframe(df_virtual_adj[['pid','name','v_cpu_alloc','v_ram_alloc','action','reason']].reset_index(drop=True), use_container_width=True)
-            else:
-                st.write("No virtual tasks after adjustments.")
-
-            st.markdown("---")
-            st.subheader("AI Decision Tree (Weights & Actions)")
-            if decisions:
-                try:
-                    df_dec = pd.DataFrame(decisions)[
-                        ['pid','name','v_cpu_alloc','v_ram_alloc','w_cpu','w_ram','w_wait','w_vis','w_hist','score','action','reason','wait_time_sec']
-                    ]
-                    st.dataframe(df_dec.reset_index(drop=True), use_container_width=True)
-                    viz_df = df_dec[['name','w_cpu','w_ram','w_wait','w_vis','w_hist','score']].set_index('name')
-                    st.bar_chart(viz_df)
-                except Exception:
-                    st.write("Decision data present but cannot render table.")
-            else:
-                st.info("No AI decisions available.")
-
-            st.markdown("---")
-            st.subheader("Virtual Scheduling Order (Priority)")
-            if decisions:
-                for idx, d in enumerate(decisions[:20], start=1):
-                    st.write(f"{idx}. {d['name']} (PID {d['pid']}) → {d['action'].upper()} | score={d['score']} | CPU={d['v_cpu_alloc']} | RAM={d['v_ram_alloc']}  — {d.get('reason','')}")
-            else:
-                st.write("No scheduled tasks.")
-
-            st.markdown("---")
-            st.subheader("Monitor Panels")
-            kc, pc, hc = st.columns([1,1,1])
-            with kc:
-                st.markdown("Killed / Resolved (recent 20)")
-                killed_df = pd.DataFrame(st.session_state['killed_history'][-20:])
-                if not killed_df.empty:
-                    st.dataframe(killed_df[['time','pid','name','v_cpu_alloc','v_ram_alloc','score','reason']].reset_index(drop=True), use_container_width=True)
-                else:
-                    st.write("No entries yet.")
-
-            with pc:
-                st.markdown("Pending (wait)")
-                if pending_list:
-                    df_pending = pd.DataFrame(pending_list).sort_values(by='score', ascending=False).reset_index(drop=True)
-                    st.dataframe(df_pending[['pid','name','v_cpu_alloc','v_ram_alloc','score']].head(50), use_container_width=True)
-                else:
-                    st.write("No pending processes.")
-
-            with hc:
-                st.markdown("High-CPU Virtual Tasks")
-                if not df_virtual_adj.empty:
-                    df_cpu_sorted = df_virtual_adj.sort_values(by='v_cpu_alloc', ascending=False).reset_index(drop=True)
-                    st.dataframe(df_cpu_sorted[['pid','name','v_cpu_alloc','v_ram_alloc']].head(20), use_container_width=True)
-                else:
-                    st.write("No virtual tasks to show.")
-
-            st.markdown("---")
-            st.subheader("AI Event Log (recent)")
-            st.text_area("System Log", "\n".join(st.session_state['log'][-50:]), height=220)
-
-            if deadlock_detected:
-                st.error("⚠️ DEADLOCK(S) DETECTED — Deadlock handler triggered.")
-                for d in deadlocked_items:
-                    st.warning(f"Deadlocked: {d['name']} (PID {d['pid']}) — reason: {d.get('reason','')}, wait_time={d.get('wait_time_sec')}")
-                st.markdown("<h3 style='color:darkred'>DEADLOCK RESOLVER RUN — see Killed/Resolved panel</h3>", unsafe_allow_html=True)
-
-        # Sleep for live refresh (no reload)
-        time.sleep(refresh_interval)
+    st_autorefresh(interval=refresh_interval * 1000, key="tick")
 else:
     st.info("Live update mode paused. Enable it from sidebar.")
+    st.stop()
+
+# one placeholder per UI section; the layout is fixed here and filled below
+host_ph = st.empty()
+summary_ph = st.empty()
+tasks_ph = st.empty()
+decisions_ph = st.empty()
+schedule_ph = st.empty()
+monitor_ph = st.empty()
+log_ph = st.empty()
+alert_ph = st.empty()
+
+# 1) host snapshot, sampled on a background thread (no psutil calls here)
+sampler = get_host_sampler()
+sampler.interval = refresh_interval
+snapshot = sampler.snapshot()
+if snapshot is None:
+    st.info("Collecting the first host sample…")
+    st.stop()
+df_host = snapshot["df_host"]
+if df_host.empty:
+    st.warning("No host process data available.")
+    st.stop()
+
+visible_windows = snapshot["visible_windows"]
+active_info = snapshot["active_info"]
+
+# 2) map host -> virtual (low-end), with the demo tasks appended in the same build
+df_virtual = map_host_to_virtual(df_host, VIRTUAL_RAM_MB, VIRTUAL_CPU_UNITS, extra_rows=EXTRA_TASKS)
+
+# 3) scoring
+# compute_scores is stateful (wait times, usage history): score each snapshot
+# once; reruns that see the same snapshot (fast ticks, widget changes) reuse it
+session_store = st.session_state['score_store']
+session_store['refresh_interval'] = refresh_interval
+scored_at, df_scores = st.session_state.get('_scored', (None, None))
+new_snapshot = scored_at != snapshot["timestamp"]
+if new_snapshot:
+    # scores stay a DataFrame; only the handful of rows shown as text become dicts
+    df_scores = compute_scores(df_virtual, visible_windows=visible_windows, session_store=session_store, as_records=False)
+    st.session_state['_scored'] = (snapshot["timestamp"], df_scores)
+
+    # persist session store
+    persist_session_store(session_store)
+
+# decision table is built once; the panels below use row/column selections of it
+df_dec = df_scores.reindex(columns=DECISION_COLUMNS).astype(DECISION_DTYPES)
+
+# 4) apply actions on parallel arrays taken from df_dec's columns
+dec_score = df_dec['score'].to_numpy()
+dec_cpu = df_dec['v_cpu_alloc'].to_numpy()
+dec_ram = df_dec['v_ram_alloc'].to_numpy()
+dec_action = df_dec['action'].cat.codes.to_numpy(dtype=np.uint8)
+
+is_wait = dec_action == WAIT
+is_preempt = dec_action == PREEMPT
+is_deadlocked = dec_action == DEADLOCKED
+
+# preempted + waiting tasks stay on the virtual PC; preempted ones shrink to 60%
+adj_idx = np.flatnonzero(is_preempt | is_wait)
+adj_cpu = dec_cpu[adj_idx]
+adj_ram = dec_ram[adj_idx]
+adj_preempt = is_preempt[adj_idx]
+adj_cpu[adj_preempt] = np.round(adj_cpu[adj_preempt] * 0.6, 2)
+adj_ram[adj_preempt] = np.round(adj_ram[adj_preempt] * 0.6, 2)
+
+pending_idx = np.flatnonzero(is_wait)
+deadlocked_items = df_scores.iloc[np.flatnonzero(is_deadlocked)].to_dict('records')
+deadlock_detected = bool(deadlocked_items)
+
+# killed + deadlocked tasks go to the history in one batch, sharing one timestamp
+# (once per snapshot, so a rerun does not record the same verdicts twice)
+if new_snapshot:
+    now_str = time.strftime("%Y-%m-%d %H:%M:%S")
+    st.session_state['killed_history'].extend(
+        {
+            "time": now_str,
+            "pid": proc["pid"],
+            "name": proc["name"],
+            "v_cpu_alloc": proc["v_cpu_alloc"],
+            "v_ram_alloc": proc["v_ram_alloc"],
+            "score": proc["score"],
+            "reason": proc.get("reason", "")
+        }
+        for proc in df_scores.iloc[np.flatnonzero(dec_action >= KILL)].to_dict('records')
+    )
+
+# 5) auto recovery/compression
+total_vram = float(adj_ram.sum())
+
+if total_vram > VIRTUAL_RAM_MB:
+    compression_ratio = min(1.0, VIRTUAL_RAM_MB / total_vram)
+    adj_ram = np.round(adj_ram * compression_ratio, 2)
+    total_vram = float(adj_ram.sum())
+
+if total_vram > VIRTUAL_RAM_MB:
+    # drop the shortest lowest-scored prefix whose RAM brings the total under the limit
+    order = np.argsort(dec_score[adj_idx], kind='stable')
+    dropped_ram = np.cumsum(adj_ram[order], dtype=np.float64)
+    n_drop = int(np.searchsorted(dropped_ram, total_vram - VIRTUAL_RAM_MB, side='left')) + 1
+    keep = np.ones(len(adj_idx), dtype=bool)
+    keep[order[:n_drop]] = False
+    adj_idx, adj_cpu, adj_ram = adj_idx[keep], adj_cpu[keep], adj_ram[keep]
+    total_vram = float(adj_ram.sum())
+
+total_vcpu = float(adj_cpu.sum())
+
+# 6) host metrics
+host_cpu_percent = snapshot["host_cpu_percent"]
+host_ram_percent = snapshot["host_ram_percent"]
+
+if total_vram < VIRTUAL_RAM_MB * 0.8:
+    status = "Stable"
+elif total_vram < VIRTUAL_RAM_MB:
+    status = "Near Limit"
+else:
+    status = "Overload"
+
+# one status line per scored snapshot (reruns on the same snapshot add nothing)
+if new_snapshot:
+    log_entry = f"{time.strftime('%H:%M:%S')} | Status: {status} | Virtual RAM {round(total_vram,2)}MB / {VIRTUAL_RAM_MB}MB | Virtual CPU {round(total_vcpu,2)} / {VIRTUAL_CPU_UNITS}"
+    st.session_state['log'].append(log_entry)
+
+# 7) UI Rendering
+df_virtual_adj = (
+    df_dec.iloc[adj_idx][['pid','name','action','reason']]
+    .assign(v_cpu_alloc=adj_cpu, v_ram_alloc=adj_ram)
+    .reset_index(drop=True)
+)
+
+with host_ph.container():
+    st.subheader("Host Snapshot")
+    hc1, hc2, hc3 = st.columns(3)
+    hc1.metric("Host CPU %", f"{host_cpu_percent}%")
+    hc2.metric("Host RAM %", f"{host_ram_percent}%")
+    hc3.write(f"Active: {active_info.get('process_name')} — {active_info.get('title')}")
+
+with summary_ph.container():
+    st.markdown("---")
+    st.subheader("Virtual PC Summary (Low-end)")
+    vc1, vc2, vc3 = st.columns(3)
+    vc1.metric("Virtual CPU Used", f"{round(total_vcpu,2)} / {VIRTUAL_CPU_UNITS}")
+    vc2.metric("Virtual RAM Used", f"{round(total_vram,2)} MB / {VIRTUAL_RAM_MB} MB")
+    vc3.write(f"Status: {status}")
+
+    st.markdown("**Resource balance (visual)**")
+    used = max(0.0, total_vcpu)
+    free = max(0.0, VIRTUAL_CPU_UNITS - used)
+    # not skipped when unchanged: Streamlit drops elements a rerun does not emit
+    used_frac = min(1.0, used / VIRTUAL_CPU_UNITS)
+    st.progress(used_frac, text=f"Used CPU {used_frac:.1%} — Free CPU {free / VIRTUAL_CPU_UNITS:.1%}")
+
+with tasks_ph.container():
+    st.markdown("---")
+    st.subheader("Virtual Task Table (Adjusted)")
+    if not df_virtual_adj.empty:
+        st.dataframe(df_virtual_adj[['pid','name','v_cpu_alloc','v_ram_alloc','action','reason']].reset_index(drop=True), use_container_width=True)
+    else:
+        st.write("No virtual tasks after adjustments.")
+
+with decisions_ph.container():
+    st.markdown("---")
+    st.subheader("AI Decision Tree (Weights & Actions)")
+    if not df_scores.empty:
+        try:
+            st.dataframe(df_dec, use_container_width=True)
+            # chart only the top-scored rows; the full set is in the table above
+            viz_df = df_dec.iloc[top_k_indices(dec_score, 20)][['name','w_cpu','w_ram','w_wait','w_vis','w_hist','score']].set_index('name')
+            st.bar_chart(viz_df)
+        except Exception:
+            st.write("Decision data present but cannot render table.")
+    else:
+        st.info("No AI decisions available.")
+
+with schedule_ph.container():
+    st.markdown("---")
+    st.subheader("Virtual Scheduling Order (Priority)")
+    if not df_scores.empty:
+        # one markdown element instead of one st.write per line
+        lines = [
+            f"{idx}. **{d['name']}** (PID {d['pid']}) → {d['action'].upper()} | score={d['score']} | CPU={d['v_cpu_alloc']} | RAM={d['v_ram_alloc']}  — {d.get('reason','')}"
+            for idx, d in enumerate(df_scores.head(20).to_dict('records'), start=1)
+        ]
+        st.markdown("\n".join(lines))
+    else:
+        st.write("No scheduled tasks.")
+
+with monitor_ph.container():
+    st.markdown("---")
+    st.subheader("Monitor Panels")
+    kc, pc, hc = st.columns([1,1,1])
+    with kc:
+        st.markdown("Killed / Resolved (recent 20)")
+        recent_killed = recent(st.session_state['killed_history'], 20)
+        killed_df = pd.DataFrame(recent_killed)
+        if not killed_df.empty:
+            st.dataframe(killed_df[['time','pid','name','v_cpu_alloc','v_ram_alloc','score','reason']].reset_index(drop=True), use_container_width=True)
+        else:
+            st.write("No entries yet.")
+
+    with pc:
+        st.markdown("Pending (wait)")
+        if len(pending_idx):
+            top_pending = pending_idx[top_k_indices(dec_score[pending_idx], 50)]
+            df_pending = df_dec.iloc[top_pending].reset_index(drop=True)
+            st.dataframe(df_pending[['pid','name','v_cpu_alloc','v_ram_alloc','score']], use_container_width=True)
+        else:
+            st.write("No pending processes.")
+
+    with hc:
+        st.markdown("High-CPU Virtual Tasks")
+        if not df_virtual_adj.empty:
+            df_cpu_top = df_virtual_adj.iloc[top_k_indices(adj_cpu, 20)].reset_index(drop=True)
+            st.dataframe(df_cpu_top[['pid','name','v_cpu_alloc','v_ram_alloc']], use_container_width=True)
+        else:
+            st.write("No virtual tasks to show.")
+
+with log_ph.container():
+    st.markdown("---")
+    st.subheader("AI Event Log (recent)")
+    st.text_area("System Log", "\n".join(recent(st.session_state['log'], 50)), height=220)
+
+if deadlock_detected:
+    with alert_ph.container():
+        st.error("⚠️ DEADLOCK(S) DETECTED — Deadlock handler triggered.")
+        for d in deadlocked_items:
+            st.warning(f"Deadlocked: {d['name']} (PID {d['pid']}) — reason: {d.get('reason','')}, wait_time={d.get('wait_time_sec')}")
+        st.markdown("<h3 style='color:darkred'>DEADLOCK RESOLVER RUN — see Killed/Resolved panel</h3>", unsafe_allow_html=True)
@@ -5,9 +5,22 @@ Decision tree scoring for low-end VM simulation.
 - explicit deadlock detection + clearer weights
 """
 
-from collections import Counter
+from collections import namedtuple
+from dataclasses import dataclass
+import functools
+import hashlib
 import logging
 
+import numpy as np
+import pandas as pd
+
+try:
+    import numba
+    _NUMBA_AVAILABLE = True
+except ImportError:  # optional: fall back to the vectorized NumPy kernel
+    numba = None
+    _NUMBA_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
 # Virtual PC configuration for low-end demo
@@ -21,146 +34,359 @@ GAMMA_WAIT = 0.15
 DELTA_VIS = 0.06
 EPS_HISTORY = 0.04
 
+
+@dataclass(frozen=True)
+class ScoringConfig:
+    """Scoring weights and thresholds; presets differ only in these numbers."""
+    virtual_ram_mb: float = VIRTUAL_RAM_MB
+    virtual_cpu_units: float = VIRTUAL_CPU_UNITS
+    alpha_cpu: float = ALPHA_CPU
+    beta_ram: float = BETA_RAM
+    gamma_wait: float = GAMMA_WAIT
+    delta_vis: float = DELTA_VIS
+    eps_history: float = EPS_HISTORY
+    ram_share: float = 0.4          # RAM normalized vs this share of virtual RAM
+    waiting_cpu_share: float = 0.06  # below this share of CPU units a task counts as waiting
+    wait_scale_sec: float = 90.0
+    hist_scale: float = 30.0
+    deadlock_wait: float = 0.75
+    deadlock_cpu: float = 0.02
+    kill_threshold: float = 0.60
+    preempt_threshold: float = 0.30
+
+    def kernel_params(self):
+        """Flat float tuple in the order _score_loop unpacks it."""
+        return (
+            float(self.virtual_ram_mb), float(self.virtual_cpu_units),
+            float(self.alpha_cpu), float(self.beta_ram), float(self.gamma_wait),
+            float(self.delta_vis), float(self.eps_history),
+            float(self.ram_share), float(self.waiting_cpu_share),
+            float(self.wait_scale_sec), float(self.hist_scale),
+            float(self.deadlock_wait), float(self.deadlock_cpu),
+            float(self.kill_threshold), float(self.preempt_threshold),
+        )
+
+
+# low-end demo (module constants above) and the larger-VM variant; BALANCED sets
+# only the values that variant is known to differ in, the rest are LOW_END's
+LOW_END = ScoringConfig()
+BALANCED = ScoringConfig(
+    virtual_ram_mb=1024,
+    alpha_cpu=0.35,
+    hist_scale=50.0,
+    kill_threshold=0.75,
+)
+
+# Action codes (uint8) for array-based consumers; ACTIONS[code] -> name
+WAIT, PREEMPT, KILL, DEADLOCKED = 0, 1, 2, 3
+ACTIONS = ("wait", "preempt", "kill", "deadlocked")
+ACTION_CODES = {name: code for code, name in enumerate(ACTIONS)}
+REASONS = (
+    "Low load — keep waiting",
+    "Moderate load — preempt to rebalance",
+    "High combined load — terminate to recover",
+    "Likely deadlock: waiting long without CPU progress",
+)
+# object arrays so a code array maps to labels with one fancy-index
+_ACTION_LABELS = np.asarray(ACTIONS, dtype=object)
+_REASON_LABELS = np.asarray(REASONS, dtype=object)
+
 # Ignore list
-IGNORE_LIST = {
+IGNORE_LIST = frozenset({
     "System Idle Process", "TextInputHost.exe", "svchost.exe",
     "RuntimeBroker.exe", "winlogon.exe", "SearchIndexer.exe",
     "System", "Idle"
-}
-
-def safe_name(value, pid):
-    try:
-        if not isinstance(value, str):
-            value = str(value)
-        name = value.strip()
-        if not name:
-            name = f"proc_{pid}"
-        return name
-    except Exception:
-        return f"proc_{pid}"
-
-def compute_scores(virtual_df, visible_windows=None, session_store=None):
+})
+
+def safe_names(values, pids):
+    """Names as stripped str (object array); blank names fall back to proc_<pid>."""
+    names = np.char.strip(np.asarray(values, dtype=object).astype(str))
+    fallback = np.char.add("proc_", np.asarray(pids).astype(str))
+    return np.where(np.char.str_len(names) == 0, fallback, names).astype(object)
+
+def numeric_column(df, column):
+    """Column as float64 array; missing/non-numeric cells (or column) become 0.0."""
+    if column not in df.columns:
+        return np.zeros(len(df))
+    return pd.to_numeric(df[column], errors='coerce').fillna(0.0).to_numpy(dtype=np.float64)
+
+def safe_pids(df):
+    """'pid' column as int64 array; missing/invalid/0 -> -1 (same as `int(pid or -1)`)."""
+    if 'pid' not in df.columns:
+        return np.full(len(df), -1, dtype=np.int64)
+    pids = pd.to_numeric(df['pid'], errors='coerce').fillna(-1).to_numpy(dtype=np.int64)
+    return np.where(pids == 0, -1, pids)
+
+def _score_loop(v_cpu, v_ram, vis_area, hist, prev_wait, refresh_interval, total_area, params):
+    """Per-process scoring kernel (compiled with numba when available)."""
+    (virtual_ram_mb, virtual_cpu_units, alpha_cpu, beta_ram, gamma_wait, delta_vis, eps_history,
+     ram_share, waiting_cpu_share, wait_scale_sec, hist_scale,
+     deadlock_wait, deadlock_cpu, kill_threshold, preempt_threshold) = params
+    n = v_cpu.shape[0]
+    w_cpu = np.empty(n)
+    w_ram = np.empty(n)
+    w_vis = np.empty(n)
+    w_hist = np.empty(n)
+    w_wait = np.empty(n)
+    score_raw = np.empty(n)
+    score = np.empty(n)
+    action = np.empty(n, dtype=np.int8)
+    new_wait = np.empty(n)
+    # RAM normalized vs a share of virtual RAM so it shows visibly on low-end
+    ram_normalizer = max(1.0, virtual_ram_mb * ram_share)
+    for i in range(n):
+        w_cpu[i] = min(max(v_cpu[i] / virtual_cpu_units, 0.0), 1.0)
+        w_ram[i] = min(max(v_ram[i] / ram_normalizer, 0.0), 1.0)
+        w_vis[i] = vis_area[i] / total_area if total_area > 0 else 0.0
+        w_hist[i] = min(hist[i] / hist_scale, 1.0)
+
+        # if allocated very small CPU, it's likely waiting
+        if v_cpu[i] < virtual_cpu_units * waiting_cpu_share:
+            new_wait[i] = prev_wait[i] + refresh_interval
+        else:
+            new_wait[i] = max(0.0, prev_wait[i] - refresh_interval)
+        w_wait[i] = min(new_wait[i] / wait_scale_sec, 1.0)
+
+        score_raw[i] = (
+            alpha_cpu * w_cpu[i] +
+            beta_ram * w_ram[i] +
+            gamma_wait * w_wait[i] +
+            delta_vis * w_vis[i] +
+            eps_history * w_hist[i]
+        )
+        score[i] = min(max(score_raw[i], 0.0), 1.0)
+
+        # Deadlock heuristic (explicit) + tuned thresholds
+        if w_wait[i] > deadlock_wait and w_cpu[i] < deadlock_cpu:
+            action[i] = DEADLOCKED
+        elif score[i] >= kill_threshold:
+            action[i] = KILL
+        elif score[i] >= preempt_threshold:
+            action[i] = PREEMPT
+        else:
+            action[i] = WAIT
+    return w_cpu, w_ram, w_vis, w_hist, w_wait, score_raw, score, action, new_wait
+
+def _score_vectorized(v_cpu, v_ram, vis_area, hist, prev_wait, refresh_interval, total_area, params):
+    """NumPy equivalent of _score_loop, used when numba is not installed."""
+    (virtual_ram_mb, virtual_cpu_units, alpha_cpu, beta_ram, gamma_wait, delta_vis, eps_history,
+     ram_share, waiting_cpu_share, wait_scale_sec, hist_scale,
+     deadlock_wait, deadlock_cpu, kill_threshold, preempt_threshold) = params
+    w_cpu = np.clip(v_cpu / virtual_cpu_units, 0.0, 1.0)
+    ram_normalizer = max(1.0, virtual_ram_mb * ram_share)
+    w_ram = np.clip(v_ram / ram_normalizer, 0.0, 1.0)
+    w_vis = vis_area / total_area if total_area > 0 else np.zeros(len(v_cpu))
+    w_hist = np.minimum(hist / hist_scale, 1.0)
+
+    new_wait = np.where(
+        v_cpu < virtual_cpu_units * waiting_cpu_share,
+        prev_wait + refresh_interval,
+        np.maximum(0.0, prev_wait - refresh_interval),
+    )
+    w_wait = np.minimum(new_wait / wait_scale_sec, 1.0)
+
+    score_raw = (
+        alpha_cpu * w_cpu +
+        beta_ram * w_ram +
+        gamma_wait * w_wait +
+        delta_vis * w_vis +
+        eps_history * w_hist
+    )
+    score = np.clip(score_raw, 0.0, 1.0)
+
+    conditions = [(w_wait > deadlock_wait) & (w_cpu < deadlock_cpu), score >= kill_threshold, score >= preempt_threshold]
+    action = np.select(conditions, [DEADLOCKED, KILL, PREEMPT], default=WAIT).astype(np.int8)
+    return w_cpu, w_ram, w_vis, w_hist, w_wait, score_raw, score, action, new_wait
+
+if _NUMBA_AVAILABLE:
+    _score_kernel = numba.njit(cache=True)(_score_loop)
+    # compile at import so the first refresh is not charged JIT time (one signature for every preset)
+    _score_kernel(np.zeros(1), np.zeros(1), np.zeros(1), np.zeros(1), np.zeros(1), 2.0, 1.0, LOW_END.kernel_params())
+else:
+    _score_kernel = _score_vectorized
+
+def _wait_slots(session_store, pids):
     """
-    Compute per-process scores and actions.
-    Returns list sorted by score desc.
+    Slot of each pid in session_store['wait_arr'] (SoA wait table keyed by
+    session_store['pid_index']). New pids get zeroed slots; the array grows by doubling.
     """
-    if visible_windows is None:
-        visible_windows = []
+    pid_index = session_store['pid_index']
+    slots = np.fromiter((pid_index.setdefault(pid, len(pid_index)) for pid in pids), dtype=np.int64, count=len(pids))
+    wait_arr = session_store['wait_arr']
+    if len(pid_index) > len(wait_arr):
+        grown = np.zeros(max(len(pid_index), 2 * len(wait_arr)), dtype=np.float32)
+        grown[:len(wait_arr)] = wait_arr
+        session_store['wait_arr'] = grown
+    return slots
+
+# usage history as a fixed-size Count-Min Sketch: memory stays bounded under
+# process churn, and w_hist saturates at hist_scale so small overcounts don't matter
+USAGE_CMS_WIDTH = 1024
+USAGE_CMS_DEPTH = 4
+_CMS_ROWS = np.arange(USAGE_CMS_DEPTH)
+
+@functools.lru_cache(maxsize=4096)
+def _cms_cells(name):
+    """Column of name in each sketch row (blake2b, so stable across restarts)."""
+    digest = hashlib.blake2b(name.encode("utf-8", "surrogatepass"), digest_size=2 * USAGE_CMS_DEPTH).digest()
+    return tuple(int.from_bytes(digest[2 * d:2 * d + 2], "little") % USAGE_CMS_WIDTH for d in range(USAGE_CMS_DEPTH))
+
+def _cms_lookup(names):
+    cells = np.array([_cms_cells(name) for name in names], dtype=np.int64)
+    return cells.reshape(len(names), USAGE_CMS_DEPTH)
+
+def _cms_add(cms, names, counts):
+    """
+    Add counts[i] to names[i] with the minimal-increment (conservative) rule:
+    a cell only rises to estimate + count, so shared cells inflate less.
+    """
+    cells = _cms_lookup(names)
+    est = cms[_CMS_ROWS, cells].min(axis=1).astype(np.int64)
+    new = np.minimum(est + np.asarray(counts, dtype=np.int64), 255).astype(np.uint8)
+    np.maximum.at(cms, (_CMS_ROWS, cells), new[:, None])
+
+def _usage_cms(session_store):
+    """
+    session_store['usage_cms'] as a (depth, width) uint8 array; a persisted
+    nested list is restored and a legacy {name: count} usage_history is folded in.
+    """
+    cms = session_store.get('usage_cms')
+    if not isinstance(cms, np.ndarray):
+        cms = np.asarray(cms if cms is not None else [], dtype=np.uint8)
+        if cms.shape != (USAGE_CMS_DEPTH, USAGE_CMS_WIDTH):
+            cms = np.zeros((USAGE_CMS_DEPTH, USAGE_CMS_WIDTH), dtype=np.uint8)
+        legacy = session_store.pop('usage_history', None) or {}
+        if legacy:
+            _cms_add(cms, [str(name) for name in legacy], [int(c) for c in legacy.values()])
+        session_store['usage_cms'] = cms
+    return cms
+
+def wait_times_dict(session_store):
+    """Export the SoA wait table as {pid: wait seconds} (e.g. for persistence)."""
+    if 'pid_index' not in session_store:
+        return dict(session_store.get('wait_times', {}))
+    wait_arr = session_store['wait_arr']
+    return {pid: float(wait_arr[slot]) for pid, slot in session_store['pid_index'].items()}
+
+# compute_scores output columns, in order
+SCORE_COLUMNS = (
+    "pid", "name", "v_cpu_alloc", "v_ram_alloc", "w_cpu", "w_ram", "w_wait", "w_vis", "w_hist",
+    "score", "raw_score", "action", "reason", "wait_time_sec",
+)
+
+# Pre-aggregated visible windows: {pid: area}, {process name: max area}, summed area
+VisibleWindows = namedtuple('VisibleWindows', ['by_pid', 'by_name_max', 'total_area'])
+
+
+def visible_windows_to_maps(windows):
+    """Aggregate a list of window dicts (pid/process_name/area) into VisibleWindows."""
+    by_pid = {}
+    by_name_max = {}
+    total_area = 0
+    for v in windows or []:
+        area = v.get('area', 0)
+        total_area += area
+        if isinstance(v.get('pid', None), int):
+            by_pid[v['pid']] = area
+        pname = v.get('process_name') or v.get('name') or ""
+        by_name_max[pname] = max(by_name_max.get(pname, 0), area)
+    return VisibleWindows(by_pid, by_name_max, total_area)
+
+
+def compute_scores(virtual_df, visible_windows=None, session_store=None, *, config=LOW_END, as_records=True):
+    """
+    Compute per-process scores and actions (vectorized over the whole frame).
+    visible_windows: VisibleWindows (as returned by vpc.get_visible_windows)
+    or a legacy list of window dicts.
+    config: ScoringConfig preset (LOW_END, BALANCED or a custom instance).
+    Returns list of dicts sorted by score desc, or the DataFrame itself
+    (columns SCORE_COLUMNS) when as_records=False.
+    """
+    if not isinstance(visible_windows, VisibleWindows):
+        visible_windows = visible_windows_to_maps(visible_windows)
     if session_store is None:
         session_store = {}
 
-    vis_by_pid = {v['pid']: v for v in visible_windows if isinstance(v.get('pid', None), int)}
-    vis_by_name = {}
-    total_screen_area = sum((v.get('area', 0) for v in visible_windows)) if visible_windows else 1
-    for v in visible_windows:
-        pname = v.get('process_name') or v.get('name') or ""
-        vis_by_name.setdefault(pname, []).append(v)
+    vis_pid_area = visible_windows.by_pid
+    vis_name_area = visible_windows.by_name_max
+    # no windows -> avoid dividing by zero
+    total_screen_area = visible_windows.total_area if vis_name_area else 1
 
-    if 'wait_times' not in session_store:
-        session_store['wait_times'] = {}
-    if 'usage_history' not in session_store:
-        session_store['usage_history'] = Counter()
+    if 'pid_index' not in session_store:
+        # move a plain {pid: wait} dict (persisted / legacy) into the SoA wait table
+        legacy = session_store.pop('wait_times', None) or {}
+        session_store['pid_index'] = {int(pid): slot for slot, pid in enumerate(legacy)}
+        session_store['wait_arr'] = np.zeros(max(64, len(legacy)), dtype=np.float32)
+        session_store['wait_arr'][:len(legacy)] = [float(w) for w in legacy.values()]
+    usage_cms = _usage_cms(session_store)
     if 'refresh_interval' not in session_store:
         session_store['refresh_interval'] = 2
 
-    wait_times = session_store['wait_times']
-    usage_history = session_store['usage_history']
     refresh_interval = session_store.get('refresh_interval', 2)
 
-    results = []
-    for _, row in virtual_df.iterrows():
-        try:
-            pid = int(row.get('pid', -1) or -1)
-        except Exception:
-            pid = -1
-        raw_name = row.get('name', 'unknown')
-        name = safe_name(raw_name, pid)
-        if name in IGNORE_LIST:
-            continue
-
-        try:
-            v_cpu = float(row.get('v_cpu_alloc', 0.0) or 0.0)
-        except Exception:
-            v_cpu = 0.0
-        try:
-            v_ram = float(row.get('v_ram_alloc', 0.0) or 0.0)
-        except Exception:
-            v_ram = 0.0
-
-        w_cpu = max(0.0, min(1.0, v_cpu / VIRTUAL_CPU_UNITS))
-
-        # RAM normalized vs 40% of virtual RAM so it shows visibly on low-end
-        ram_normalizer = max(1.0, VIRTUAL_RAM_MB * 0.4)
-        w_ram = max(0.0, min(1.0, v_ram / ram_normalizer))
-
-        vis_area = 0
-        if pid in vis_by_pid:
-            vis_area = vis_by_pid[pid].get('area', 0)
-        elif name in vis_by_name:
-            try:
-                vis_area = max(v.get('area', 0) for v in vis_by_name[name])
-            except Exception:
-                vis_area = 0
-        w_vis = (vis_area / total_screen_area) if total_screen_area > 0 else 0.0
-
-        try:
-            if vis_area > 0 or v_cpu > 1.0:
-                usage_history[name] += 1
-        except Exception:
-            usage_history[name] = usage_history.get(name, 0) + 1
-
-        w_hist = min(usage_history.get(name, 0) / 30.0, 1.0)
-
-        prev_wait = wait_times.get(pid, 0.0)
-        if v_cpu < (VIRTUAL_CPU_UNITS * 0.06):  # if allocated very small CPU, it's likely waiting
-            prev_wait += refresh_interval
-        else:
-            prev_wait = max(0.0, prev_wait - refresh_interval)
-        wait_times[pid] = prev_wait
-        w_wait = min(prev_wait / 90.0, 1.0)
-
-        score_raw = (
-            ALPHA_CPU * w_cpu +
-            BETA_RAM * w_ram +
-            GAMMA_WAIT * w_wait +
-            DELTA_VIS * w_vis +
-            EPS_HISTORY * w_hist
-        )
-        score = max(0.0, min(1.0, score_raw))
-
-        # Deadlock heuristic (explicit) + tuned thresholds for low-end demo
-        action = "wait"
-        reason = "Low load — keep waiting"
-        if w_wait > 0.75 and w_cpu < 0.02:
-            action = "deadlocked"
-            reason = "Likely deadlock: waiting long without CPU progress"
-        elif score >= 0.60:
-            action = "kill"
-            reason = "High combined load — terminate to recover"
-        elif score >= 0.30:
-            action = "preempt"
-            reason = "Moderate load — preempt to rebalance"
-
-        results.append({
-            "pid": pid,
-            "name": name,
-            "v_cpu_alloc": round(v_cpu, 2),
-            "v_ram_alloc": round(v_ram, 2),
-            "w_cpu": round(w_cpu, 3),
-            "w_ram": round(w_ram, 3),
-            "w_wait": round(w_wait, 3),
-            "w_vis": round(w_vis, 3),
-            "w_hist": round(w_hist, 3),
-            "score": round(score, 3),
-            "raw_score": round(score_raw, 4),
-            "action": action,
-            "reason": reason,
-            "wait_time_sec": round(wait_times.get(pid, 0.0), 1)
-        })
-
-    session_store['wait_times'] = wait_times
-    session_store['usage_history'] = usage_history
+    if virtual_df is None or virtual_df.empty:
+        return [] if as_records else pd.DataFrame(columns=SCORE_COLUMNS)
+
+    pids = safe_pids(virtual_df)
+    raw_names = virtual_df['name'] if 'name' in virtual_df.columns else ['unknown'] * len(virtual_df)
+    names = safe_names(raw_names, pids)
+
+    # drop ignored system processes up front (one C-level hash probe per row)
+    if 'name' in virtual_df.columns:
+        keep = ~pd.Series(names).isin(IGNORE_LIST).to_numpy()
+        virtual_df, pids, names = virtual_df.loc[keep], pids[keep], names[keep]
+        if virtual_df.empty:
+            return [] if as_records else pd.DataFrame(columns=SCORE_COLUMNS)
+    v_cpu = numeric_column(virtual_df, 'v_cpu_alloc')
+    v_ram = numeric_column(virtual_df, 'v_ram_alloc')
+
+    vis_area = np.array([
+        vis_pid_area[pid] if pid in vis_pid_area else vis_name_area.get(name, 0)
+        for pid, name in zip(pids.tolist(), names)
+    ], dtype=np.float64)
+
+    # usage history: each active row bumps its name; rows see the count after their own bump
+    active = (vis_area > 0) | (v_cpu > 1.0)
+    uniq, inverse = np.unique(names, return_inverse=True)
+    cells = _cms_lookup(uniq)
+    prev_hist = usage_cms[_CMS_ROWS, cells].min(axis=1).astype(np.float64)
+    hist = prev_hist[inverse] + pd.Series(active.astype(np.int64)).groupby(names, sort=False).cumsum().to_numpy()
+    bumps = np.bincount(inverse, weights=active, minlength=len(uniq)).astype(np.int64)
+    if bumps.any():
+        _cms_add(usage_cms, uniq[bumps > 0], bumps[bumps > 0])
+
+    slots = _wait_slots(session_store, pids.tolist())
+    wait_arr = session_store['wait_arr']
+    prev_wait = wait_arr[slots].astype(np.float64)
+
+    w_cpu, w_ram, w_vis, w_hist, w_wait, score_raw, score, action_code, new_wait = _score_kernel(
+        v_cpu, v_ram, vis_area, hist, prev_wait, float(refresh_interval), float(total_screen_area),
+        config.kernel_params(),
+    )
+    wait_arr[slots] = new_wait
+    action = _ACTION_LABELS[action_code]
+    reason = _REASON_LABELS[action_code]
+
+    # sort by the displayed (rounded) score, desc; stable so ties keep frame order
+    score_out = np.round(score, 3)
+    order = np.argsort(-score_out, kind="stable")
+    df_out = pd.DataFrame({
+        "pid": pids[order],
+        "name": names[order],
+        "v_cpu_alloc": np.round(v_cpu[order], 2),
+        "v_ram_alloc": np.round(v_ram[order], 2),
+        "w_cpu": np.round(w_cpu[order], 3),
+        "w_ram": np.round(w_ram[order], 3),
+        "w_wait": np.round(w_wait[order], 3),
+        "w_vis": np.round(w_vis[order], 3),
+        "w_hist": np.round(w_hist[order], 3),
+        "score": score_out[order],
+        "raw_score": np.round(score_raw[order], 4),
+        "action": action[order],
+        "reason": reason[order],
+        "wait_time_sec": np.round(new_wait[order], 1),
+    })
+
     session_store['refresh_interval'] = refresh_interval
 
-    results.sort(key=lambda x: x['score'], reverse=True)
-    return results
+    return df_out.to_dict("records") if as_records else df_out
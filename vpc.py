@@ -4,44 +4,89 @@ Host -> Virtual mapping and Windows visibility helpers.
 Designed for low-end VM simulation:
  - map_host_to_virtual: proportional CPU mapping (so total <= VIRTUAL_CPU_UNITS)
  - get_visible_windows, get_active_window_info
+ - sample_host / HostSampler: background host snapshots for the UI
 """
 
+import functools
+import threading
+import time
 import ctypes
 from ctypes import wintypes
+import numpy as np
 import psutil
 import win32gui
 import win32process
 import logging
 
+from decision_tree import IGNORE_LIST, VisibleWindows, numeric_column, safe_names, safe_pids
+
 logger = logging.getLogger(__name__)
 
-def get_visible_windows(min_area=3000):
-    visible_windows = []
+# compact dtypes for the virtual task frame (values are small, names repeat)
+VIRTUAL_DTYPES = {"pid": "int32", "name": "category", "v_cpu_alloc": "float32", "v_ram_alloc": "float32"}
+
+# pid -> process name cache; cleared every PID_NAME_TTL seconds to handle pid reuse
+PID_NAME_TTL = 60.0
+_pid_name_cleared_at = time.monotonic()
+
+
+@functools.lru_cache(maxsize=256)
+def _pid_name(pid):
+    try:
+        return psutil.Process(pid).name()
+    except Exception:
+        return "Unknown"
+
+
+def pid_name(pid):
+    global _pid_name_cleared_at
+    now = time.monotonic()
+    if now - _pid_name_cleared_at > PID_NAME_TTL:
+        _pid_name.cache_clear()
+        _pid_name_cleared_at = now
+    return _pid_name(pid)
+
+
+def _pid_names():
+    """pid -> process name for every running process, from one process_iter pass."""
+    try:
+        return {p.info["pid"]: p.info["name"] or "Unknown"
+                for p in psutil.process_iter(attrs=["pid", "name"])}
+    except Exception as e:
+        logger.debug("process_iter failed: %s", e)
+        return {}
+
+
+def get_visible_windows(min_area=3000, pid_names=None):
+    """
+    Enumerate titled top-level windows of at least min_area pixels, aggregated
+    on the fly into VisibleWindows(by_pid, by_name_max, total_area).
+    pid_names: pid -> name map the caller already has (e.g. from sample_host);
+    the process table is walked here only when it is not given.
+    """
+    by_pid = {}
+    by_name_max = {}
+    total_area = 0
+    if pid_names is None:
+        pid_names = _pid_names()
 
     def enum_window_callback(hwnd, _):
+        nonlocal total_area
         try:
             if not win32gui.IsWindowVisible(hwnd):
                 return
-            rect = win32gui.GetWindowRect(hwnd)
-            x, y, right, bottom = rect
-            width, height = right - x, bottom - y
-            area = max(0, width * height)
+            # cheap geometry gate first: GetWindowText is a cross-thread message
+            x, y, right, bottom = win32gui.GetWindowRect(hwnd)
+            area = max(0, (right - x) * (bottom - y))
             if area < min_area:
                 return
             _, pid = win32process.GetWindowThreadProcessId(hwnd)
-            try:
-                proc = psutil.Process(pid)
-                name = proc.name()
-            except Exception:
-                name = "Unknown"
+            name = pid_names.get(pid) or pid_name(pid)
             title = win32gui.GetWindowText(hwnd)
             if title and title.strip():
-                visible_windows.append({
-                    "pid": int(pid),
-                    "process_name": name,
-                    "title": title,
-                    "area": area
-                })
+                total_area += area
+                by_pid[int(pid)] = area
+                by_name_max[name] = max(by_name_max.get(name, 0), area)
         except Exception as e:
             logger.debug("enum_window_callback error: %s", e)
 
@@ -49,8 +94,8 @@ def get_visible_windows(min_area=3000):
         win32gui.EnumWindows(enum_window_callback, None)
     except Exception as e:
         logger.exception("EnumWindows failed: %s", e)
-        return []
-    return visible_windows
+        return VisibleWindows({}, {}, 0)
+    return VisibleWindows(by_pid, by_name_max, total_area)
 
 
 def get_active_window_info():
@@ -60,74 +105,179 @@ def get_active_window_info():
         ctypes.windll.user32.GetWindowThreadProcessId(hwnd, ctypes.byref(pid))
         pid = pid.value
         title = win32gui.GetWindowText(hwnd)
-        name = "Unknown"
-        try:
-            proc = psutil.Process(pid)
-            name = proc.name()
-        except Exception:
-            pass
+        name = pid_name(pid)
         return {"pid": pid or -1, "process_name": name, "title": title}
     except Exception:
         return {"pid": -1, "process_name": "Unknown", "title": ""}
 
 
-def map_host_to_virtual(df_host, VIRTUAL_RAM_MB=512, VIRTUAL_CPU_UNITS=50):
+@functools.lru_cache(maxsize=1)
+def _system_ram_mb():
+    """Total host RAM in MB (constant for the process lifetime, so queried once)."""
+    return psutil.virtual_memory().total / (1024 * 1024)
+
+
+def _virtual_frame(pid, name, v_cpu, v_ram, extra_rows):
+    """Virtual task frame from host columns + fixed extra rows, built once (no concat)."""
+    import pandas as pd
+    return pd.DataFrame({
+        "pid": np.concatenate([pid, np.asarray([r["pid"] for r in extra_rows], dtype=np.int64)]),
+        "name": np.concatenate([name, np.asarray([r["name"] for r in extra_rows], dtype=object)]),
+        "v_cpu_alloc": np.concatenate([v_cpu, np.asarray([r["v_cpu_alloc"] for r in extra_rows], dtype=np.float64)]),
+        "v_ram_alloc": np.concatenate([v_ram, np.asarray([r["v_ram_alloc"] for r in extra_rows], dtype=np.float64)]),
+    }).astype(VIRTUAL_DTYPES)
+
+
+def map_host_to_virtual(df_host, VIRTUAL_RAM_MB=512, VIRTUAL_CPU_UNITS=50, extra_rows=None):
     """
     Map host process metrics to virtual allocations (for low-end simulation).
     - CPU: proportional mapping so sum(v_cpu_alloc) ~= VIRTUAL_CPU_UNITS
     - RAM: scale relative to host memory but clamped to virtual size
+    - extra_rows: fixed rows appended as-is (built in the same DataFrame, no concat)
     Returns pandas.DataFrame with columns: pid, name, v_cpu_alloc, v_ram_alloc
     """
-    import pandas as pd
-    rows = []
+    extra_rows = list(extra_rows or [])
+    empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=object), np.empty(0), np.empty(0))
     try:
-        system_ram_mb = psutil.virtual_memory().total / (1024 * 1024)
+        system_ram_mb = _system_ram_mb()
     except Exception:
         system_ram_mb = max(1024, VIRTUAL_RAM_MB)
 
     if df_host is None or df_host.empty:
-        return pd.DataFrame(rows)
+        return _virtual_frame(*empty, extra_rows)
 
-    # filter tiny processes
+    # coerce numeric columns once (C-level; bad cells -> 0.0), then filter tiny processes
+    cpu = numeric_column(df_host, "cpu_percent")
     if "memory_percent" in df_host.columns:
-        df_host = df_host[df_host["memory_percent"] > 0.02]
+        mem_pct = numeric_column(df_host, "memory_percent")
+        keep = mem_pct > 0.02
+        df_host, cpu, mem_pct = df_host[keep], cpu[keep], mem_pct[keep]
+    else:
+        mem_pct = np.zeros(len(df_host))
 
     # defensive guard
     if df_host.empty:
-        return pd.DataFrame(rows)
+        return _virtual_frame(*empty, extra_rows)
 
     # Total CPU across filtered processes (avoid per-process CPU% summation overflow)
-    total_cpu = float(df_host["cpu_percent"].sum() or 1.0)
+    total_cpu = float(cpu.sum() or 1.0)
+
+    # drop ignored system processes here so compute_scores never sees them
+    # (after total_cpu, so the remaining processes keep their CPU share)
+    if "name" in df_host.columns:
+        shown = ~df_host["name"].astype(str).str.strip().isin(IGNORE_LIST).to_numpy()
+        df_host, cpu, mem_pct = df_host[shown], cpu[shown], mem_pct[shown]
+
+    pid = safe_pids(df_host)
+    raw_names = df_host["name"] if "name" in df_host.columns else [""] * len(df_host)
+    name = safe_names(raw_names, pid)
 
     # scaling factor to avoid extremely large per-process RAM mapping
     host_reference = max(system_ram_mb * 0.5, VIRTUAL_RAM_MB)
     scaling_factor = min(1.0, VIRTUAL_RAM_MB / host_reference) if host_reference > 0 else 1.0
 
-    for _, r in df_host.iterrows():
+    # CPU: proportional so total approx VIRTUAL_CPU_UNITS,
+    # clamped per process to a reasonable share (40% of units)
+    v_cpu = np.clip((cpu / total_cpu) * VIRTUAL_CPU_UNITS, 0.0, VIRTUAL_CPU_UNITS * 0.4)
+
+    # RAM: host MB scaled down, clamped to 90% of virtual RAM
+    v_ram = np.clip((mem_pct / 100.0) * system_ram_mb * scaling_factor, 0.0, VIRTUAL_RAM_MB * 0.9)
+
+    return _virtual_frame(pid, name, np.round(v_cpu, 2), np.round(v_ram, 2), extra_rows)
+
+
+def seed_cpu_percent():
+    """Prime per-process and host cpu_percent so later non-blocking calls return deltas."""
+    psutil.cpu_percent(interval=None)
+    for proc in psutil.process_iter():
         try:
-            pid = int(r.get('pid', -1) or -1)
-            name = str(r.get('name', f"proc_{pid}")).strip() or f"proc_{pid}"
-            cpu = float(r.get('cpu_percent', 0.0) or 0.0)
-            mem_pct = float(r.get('memory_percent', 0.0) or 0.0)
-
-            # CPU: proportional so total approx VIRTUAL_CPU_UNITS
-            v_cpu = (cpu / total_cpu) * VIRTUAL_CPU_UNITS if total_cpu > 0 else 0.0
-            # clamp single process to reasonable share (40% of units)
-            v_cpu = max(0.0, min(v_cpu, VIRTUAL_CPU_UNITS * 0.4))
-
-            # RAM:
-            host_proc_ram_mb = (mem_pct / 100.0) * system_ram_mb
-            v_ram = host_proc_ram_mb * scaling_factor
-            v_ram = max(0.0, min(v_ram, VIRTUAL_RAM_MB * 0.9))
-
-            rows.append({
-                "pid": pid,
-                "name": name,
-                "v_cpu_alloc": round(v_cpu, 2),
-                "v_ram_alloc": round(v_ram, 2)
-            })
-        except Exception as e:
-            logger.debug("map_host_to_virtual: skip row due to %s", e)
+            proc.cpu_percent(interval=None)
+        except Exception:
+            pass
+
+
+def sample_host():
+    """
+    Take one host snapshot (single pass over the process table).
+    Returns dict: df_host, visible_windows, active_info, host_cpu_percent,
+    host_ram_percent, timestamp
+    """
+    import pandas as pd
+    pids, names, cpus, mems = [], [], [], []
+    # no attrs: process_iter would otherwise run as_dict() per process;
+    # it reuses cached Process objects, so cpu_percent is the delta since last sample
+    for proc in psutil.process_iter():
+        try:
+            with proc.oneshot():
+                name = proc.name()
+                cpu = proc.cpu_percent(interval=None)
+                mem = proc.memory_percent()
+            pids.append(proc.pid)
+            names.append(name)
+            cpus.append(cpu)
+            mems.append(mem)
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
             continue
+        except Exception:
+            continue
+
+    # build columns directly (no per-row dict inference)
+    df_host = pd.DataFrame({
+        "pid": np.asarray(pids, dtype=np.int32),
+        "name": pd.Categorical(names),
+        "cpu_percent": np.asarray(cpus, dtype=np.float32),
+        "memory_percent": np.asarray(mems, dtype=np.float32),
+    })
+    return {
+        "df_host": df_host,
+        # reuse this pass's names; pids newer than it fall back to pid_name()
+        "visible_windows": get_visible_windows(pid_names=dict(zip(pids, names))),
+        "active_info": get_active_window_info(),
+        "host_cpu_percent": psutil.cpu_percent(interval=None),
+        "host_ram_percent": psutil.virtual_memory().percent,
+        "timestamp": time.time(),
+    }
+
+
+class HostSampler:
+    """
+    Samples the host on a daemon thread every `interval` seconds.
+    Each sample is built off-lock and swapped in under the lock, so
+    snapshot() is just a reference read for the UI thread.
+    """
 
-    return pd.DataFrame(rows)
+    def __init__(self, interval=3):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._latest = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="host-sampler", daemon=True)
+        self._thread.start()
+
+    def snapshot(self):
+        with self._lock:
+            return self._latest
+
+    def _sample(self):
+        snapshot = sample_host()
+        with self._lock:
+            self._latest = snapshot
+
+    def _run(self):
+        # first snapshot after a short stable cpu_percent window, off the script thread
+        try:
+            seed_cpu_percent()
+            time.sleep(0.2)
+            self._sample()
+        except Exception as e:
+            logger.exception("host sampling failed: %s", e)
+        while True:
+            time.sleep(self.interval)
+            try:
+                self._sample()
+            except Exception as e:
+                logger.exception("host sampling failed: %s", e)